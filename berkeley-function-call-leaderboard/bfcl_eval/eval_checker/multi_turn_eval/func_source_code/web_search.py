@@ -1,12 +1,22 @@
+import atexit
+import functools
+import json
 import os
 import random
+import string
 import time
+from email.message import Message
+from http.cookiejar import DefaultCookiePolicy
 from typing import Optional
 from urllib.parse import urlparse
 
 import html2text
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from urllib3.util import Retry
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import ParserRejectedMarkup
 
 ERROR_TEMPLATES = [
     "503 Server Error: Service Unavailable for url: {url}",
@@ -25,6 +35,281 @@ ERROR_TEMPLATES = [
     ),
 ]
 
+# ERROR_TEMPLATES pre-split into (literal, field, format_spec) chunks, so rendering
+# an error message does not re-parse the template string each time
+_PARSED_ERROR_TEMPLATES = [
+    tuple(
+        (literal, field, spec)
+        for literal, field, spec, _ in string.Formatter().parse(template)
+    )
+    for template in ERROR_TEMPLATES
+]
+
+SERPER_SEARCH_URL = "https://google.serper.dev/search"
+
+
+class SerperRetry(Retry):
+    """
+    `Retry` that announces each rate-limit wait, honouring Retry-After (either
+    delay-seconds or an HTTP date) before falling back to exponential back-off.
+    """
+
+    def sleep(self, response=None) -> None:
+        if response is not None and response.status == 429:
+            wait_time = None
+            if self.respect_retry_after_header:
+                wait_time = self.get_retry_after(response)
+            if wait_time is None:
+                wait_time = self.get_backoff_time()
+            error_block = (
+                "*" * 100
+                + "\n❗️❗️ [WebSearchAPI] Received 429 from Serper API. "
+                  "The number of requests sent using this API key exceeds your rate/budget. "
+                  f"Retrying in {wait_time:.1f} seconds…"
+                + "\n" + "*" * 100
+            )
+            print(error_block)
+        super().sleep(response)
+
+
+# Retry policy for Serper calls: exponential back-off (capped at 120s) on rate
+# limits and gateway errors, deferring to the server's Retry-After when present.
+# The final response is returned rather than raised once retries run out.
+SERPER_RETRY = SerperRetry(
+    total=8,
+    backoff_factor=2,
+    status_forcelist=(429, 502, 503, 504),
+    respect_retry_after_header=True,
+    allowed_methods=frozenset(["POST", "GET"]),
+    raise_on_status=False,
+)
+
+# Browser-like headers used when fetching pages, so sites serve their regular HTML
+BROWSER_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/112.0.0.0 Safari/537.36"
+    ),
+    "Accept": (
+        "text/html,application/xhtml+xml,application/xml;q=0.9,"
+        "image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7"
+    ),
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+    "Referer": "https://www.google.com/",
+    "Sec-Fetch-Site": "same-origin",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-User": "?1",
+    "Sec-Fetch-Dest": "document",
+}
+
+# Truncate mode only reports the page title and the <body> text. Anything else in
+# <head> is never built, including text a full parse would have kept there (e.g.
+# a <noscript> placed in <head>)
+TITLE_AND_BODY_STRAINER = SoupStrainer(["title", "body"])
+
+# Upper bound on how much of a fetched page body is downloaded; anything past it
+# is dropped (the HTML parsers cope fine with a cut-off document)
+MAX_CONTENT_BYTES = 5 * 1024 * 1024
+
+
+def _read_capped(response: requests.Response, limit: int = MAX_CONTENT_BYTES) -> bytes:
+    """
+    Read a streamed response body, stopping once `limit` decoded bytes are read.
+    """
+    body = bytearray()
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        body += chunk
+        if len(body) >= limit:
+            del body[limit:]
+            break
+    return bytes(body)
+
+
+def _decode_body(content: bytes, encoding: Optional[str]) -> str:
+    """
+    Decode a page body the way `response.text` does, minus the character-set
+    sniffing (which would need the full body): fall back to UTF-8 when there
+    is no usable encoding.
+    """
+    try:
+        return str(content, encoding or "utf-8", errors="replace")
+    except LookupError:
+        return str(content, "utf-8", errors="replace")
+
+
+def _declared_charset(response: requests.Response) -> Optional[str]:
+    """
+    Return the charset explicitly given in the Content-Type header, if any.
+
+    Unlike `response.encoding`, this does not fall back to ISO-8859-1 for text/*
+    responses, so an undeclared charset is left for the HTML parser to work out.
+    """
+    header = Message()
+    header["Content-Type"] = response.headers.get("Content-Type", "")
+    return header.get_content_charset()
+
+
+# How long an origin that failed to connect is answered from the negative cache
+BAD_HOST_TTL = 300
+
+
+def _url_origin(url: str) -> Optional[str]:
+    """
+    Return `scheme://host[:port]` for `url` (without credentials), or None if it has
+    no host or cannot be parsed. Malformed URLs are left for the request itself to
+    reject, so the caller still gets the usual error dict.
+    """
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        # e.g. an unterminated IPv6 literal such as "http://[::1"
+        return None
+    netloc = parsed.netloc.rpartition("@")[2]
+    if not netloc:
+        return None
+    return f"{parsed.scheme}://{netloc}"
+
+
+def _url_path(url: str) -> str:
+    """
+    Return the path and query of `url` as it appears in urllib3's error messages.
+    """
+    parsed = urlparse(url)
+    path = parsed.path or "/"
+    if parsed.query:
+        path += "?" + parsed.query
+    return path
+
+
+def _is_connect_failure(error: requests.ConnectionError) -> bool:
+    """
+    Whether `error` means no connection was made at all (DNS failure, refused,
+    connect timeout or TLS failure), as opposed to an established connection
+    being dropped, e.g. a stale pooled keep-alive socket ("Connection aborted").
+    """
+    if isinstance(error, (requests.ConnectTimeout, requests.exceptions.SSLError)):
+        return True
+    # DNS and refused connections surface as MaxRetryError(reason=NewConnectionError)
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _build_session() -> requests.Session:
+    """
+    Build the pooled session shared by all WebSearchAPI instances.
+
+    One instance is created per test entry, so the session lives at module level
+    to keep connections warm across entries and threads.
+    """
+    session = requests.Session()
+    # Never store cookies: the session outlives any single test entry, and pages
+    # must not depend on which entries (or threads) fetched before them
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    # Sized for the generation thread pool, which may run many entries at once
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # Longest prefix wins, so only Serper calls get the retrying adapter;
+    # page fetches still fail fast on the first error
+    session.mount(
+        "https://google.serper.dev",
+        HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=SERPER_RETRY),
+    )
+    return session
+
+
+_SESSION = _build_session()
+# Close the pooled keep-alive connections cleanly when the evaluation exits
+atexit.register(_SESSION.close)
+
+
+class SerperError(Exception):
+    """
+    Raised by `_query_serper` so that failed queries are never cached.
+    """
+
+
+def _serper_request_body(keywords: str, region: Optional[str]) -> bytes:
+    """
+    Build the JSON request body for a Serper query.
+
+    The serialized body doubles as the `_query_serper` cache key, which stays
+    hashable even if the model passes non-string arguments (e.g. a list of keywords).
+    """
+    # Serper basic payload
+    payload = {"q": keywords}
+
+    # Best-effort use of `region` as Serper's `location` parameter
+    # (You can map your region codes to human-readable locations if you like.)
+    if region and region != "wt-wt":
+        payload["location"] = region
+
+    try:
+        # Same serialization as `requests`' `json=` argument
+        return json.dumps(payload, allow_nan=False).encode("utf-8")
+    except (TypeError, ValueError) as e:
+        raise SerperError(f"Error calling Serper API: {str(e)}")
+
+
+@functools.lru_cache(maxsize=4096)
+def _query_serper(body: bytes, api_key: str) -> list:
+    """
+    Query Serper and return its organic results, memoized per request body, i.e.
+    per (keywords, region).
+
+    Test scenarios are replayed deterministically, so identical queries are common.
+    `max_results` is deliberately not part of the key: callers slice the returned
+    list, which must be treated as read-only since it is shared between them.
+    """
+    headers = {
+        "X-API-KEY": api_key,
+        "Content-Type": "application/json",
+    }
+
+    # Rate limits (429) and gateway errors are retried by the session's
+    # adapter, which honours Retry-After; see `SERPER_RETRY`
+    try:
+        response = _SESSION.post(
+            SERPER_SEARCH_URL,
+            headers=headers,
+            data=body,
+            timeout=20,
+        )
+    except Exception as e:
+        # Network / transport-level error that outlasted the adapter's retries
+        error_block = (
+            "*" * 100
+            + f"\n❗️❗️ [WebSearchAPI] Error calling Serper API: {str(e)}. "
+              "Giving up after exhausting retries."
+            + "*" * 100
+        )
+        print(error_block)
+        raise SerperError(f"Error calling Serper API: {str(e)}")
+
+    # Non-retryable status, or retries exhausted
+    if not response.ok:
+        raise SerperError(
+            f"Serper API returned HTTP {response.status_code}: {response.text}"
+        )
+
+    # Successful response
+    try:
+        search_results = response.json()
+    except ValueError as e:
+        raise SerperError(f"Failed to parse JSON from Serper API: {str(e)}")
+
+    # Serper returns organic results under the 'organic' key
+    if "organic" not in search_results:
+        raise SerperError(
+            "Failed to retrieve the search results from server. Please try again later."
+        )
+
+    return search_results["organic"]
+
 
 class WebSearchAPI:
     def __init__(self):
@@ -33,9 +318,11 @@ class WebSearchAPI:
             "It provides functions to search the web and browse search results."
         )
         self.show_snippet = True
-        # Random generators (kept for compatibility with your error simulation)
-        self._random = random.Random(337)
-        self._rng = random.Random(1053)
+        # Random generator for the error simulation, seeded on first use; see `_get_rng`
+        self._rng = None
+        # Negative cache of origins (scheme://host:port) that just failed to
+        # connect, as origin -> (expiry on the monotonic clock, error, failed path)
+        self._bad_hosts: dict[str, tuple[float, str, str]] = {}
 
     def _load_scenario(self, initial_config: dict, long_context: bool = False):
         # We don't care about the long_context parameter here
@@ -72,77 +359,11 @@ class WebSearchAPI:
                          "Please set it to your Serper API key."
             }
 
-        backoff = 2  # initial back-off in seconds
-
-        # Serper basic payload
-        payload = {"q": keywords}
-
-        # Best-effort use of `region` as Serper's `location` parameter
-        # (You can map your region codes to human-readable locations if you like.)
-        if region and region != "wt-wt":
-            payload["location"] = region
-
-        headers = {
-            "X-API-KEY": api_key,
-            "Content-Type": "application/json",
-        }
-
-        # Infinite retry loop with exponential backoff for 429
-        while True:
-            try:
-                response = requests.post(
-                    "https://google.serper.dev/search",
-                    headers=headers,
-                    json=payload,
-                    timeout=20,
-                )
-            except Exception as e:
-                # Network / transport-level error
-                error_block = (
-                    "*" * 100
-                    + f"\n❗️❗️ [WebSearchAPI] Error calling Serper API: {str(e)}. "
-                      "This is not a rate-limit error, so it will not be retried."
-                    + "*" * 100
-                )
-                print(error_block)
-                return {"error": f"Error calling Serper API: {str(e)}"}
-
-            # Handle HTTP 429 with exponential backoff
-            if response.status_code == 429:
-                wait_time = backoff + random.uniform(0, backoff)
-                error_block = (
-                    "*" * 100
-                    + "\n❗️❗️ [WebSearchAPI] Received 429 from Serper API. "
-                      "The number of requests sent using this API key exceeds your rate/budget. "
-                      f"Retrying in {wait_time:.1f} seconds…"
-                    + "\n" + "*" * 100
-                )
-                print(error_block)
-                time.sleep(wait_time)
-                backoff = min(backoff * 2, 120)  # cap the back-off
-                continue
-
-            # Any other non-success response: return as error, no retry
-            if not response.ok:
-                return {
-                    "error": f"Serper API returned HTTP {response.status_code}: {response.text}"
-                }
-
-            # Successful response
-            try:
-                search_results = response.json()
-            except ValueError as e:
-                return {"error": f"Failed to parse JSON from Serper API: {str(e)}"}
-
-            break
-
-        # Serper returns organic results under the 'organic' key
-        if "organic" not in search_results:
-            return {
-                "error": "Failed to retrieve the search results from server. Please try again later."
-            }
-
-        organic_results = search_results["organic"]
+        try:
+            body = _serper_request_body(keywords, region)
+            organic_results = _query_serper(body, api_key)
+        except SerperError as e:
+            return {"error": str(e)}
 
         # Convert to your existing format:
         #   [{'title': ..., 'href': ..., 'body': ...}, ...]
@@ -185,42 +406,78 @@ class WebSearchAPI:
         if not url.startswith(("http://", "https://")):
             raise ValueError(f"Invalid URL: {url}")
 
-        try:
-            headers = {
-                "User-Agent": (
-                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                    "Chrome/112.0.0.0 Safari/537.36"
-                ),
-                "Accept": (
-                    "text/html,application/xhtml+xml,application/xml;q=0.9,"
-                    "image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7"
-                ),
-                "Accept-Language": "en-US,en;q=0.9",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Connection": "keep-alive",
-                "Upgrade-Insecure-Requests": "1",
-                "Referer": "https://www.google.com/",
-                "Sec-Fetch-Site": "same-origin",
-                "Sec-Fetch-Mode": "navigate",
-                "Sec-Fetch-User": "?1",
-                "Sec-Fetch-Dest": "document",
-            }
-            response = requests.get(url, headers=headers, timeout=20, allow_redirects=True)
-            response.raise_for_status()
+        # Origins that just failed to connect are answered from the negative
+        # cache rather than waiting out another connect timeout
+        origin = _url_origin(url)
+        bad_host_error = self._get_bad_host_error(origin, url)
+        if bad_host_error is not None:
+            return {"error": f"An error occurred while fetching {url}: {bad_host_error}"}
 
+        try:
+            # Stream the body so a runaway page can never be held in memory whole
+            try:
+                response = _SESSION.get(
+                    url,
+                    headers=BROWSER_HEADERS,
+                    timeout=20,
+                    stream=True,
+                    allow_redirects=True,
+                )
+            except requests.ConnectionError as e:
+                # Only cache failures where no connection was made at all (DNS,
+                # refused, TLS or connect timeout), which concern the whole origin.
+                # Dropped connections and errors while reading the body (e.g. a
+                # read timeout mid-stream, which requests also raises as
+                # ConnectionError) are deliberately not cached. After a redirect,
+                # the origin that failed is the redirect target.
+                if _is_connect_failure(e):
+                    failed_url = e.request.url if e.request is not None else url
+                    self._mark_bad_host(_url_origin(failed_url), _url_path(failed_url), e)
+                return {"error": f"An error occurred while fetching {url}: {str(e)}"}
+
+            with response:
+                response.raise_for_status()
+                content = _read_capped(response)
+                encoding = response.encoding
+                declared_charset = _declared_charset(response)
+            self._bad_hosts.pop(origin, None)
+
+            # Only raw and markdown need text; truncate hands lxml the bytes
             if mode == "raw":
-                return {"content": response.text}
+                return {"content": _decode_body(content, encoding)}
 
             elif mode == "markdown":
+                text = _decode_body(content, encoding)
+                # A fresh converter per page is deliberate: HTML2Text keeps list,
+                # quote and link state between `handle` calls, and construction
+                # is negligible next to the conversion itself
                 converter = html2text.HTML2Text()
-                markdown = converter.handle(response.text)
+                markdown = converter.handle(text)
                 return {"content": markdown}
 
             elif mode == "truncate":
-                soup = BeautifulSoup(response.text, "html.parser")
-
-                # Remove scripts and styles
+                # Hand lxml the raw bytes so it can sniff the encoding itself,
+                # and only build the <title> and <body> subtrees; lxml always
+                # synthesizes a body, even for fragments. Text elsewhere in
+                # <head> is dropped. A charset declared in the headers is
+                # passed along so bs4 can skip its statistical detection. bs4
+                # re-raises lxml's ParserError as ParserRejectedMarkup, in which
+                # case fall back to the more lenient built-in parser on the
+                # whole document.
+                try:
+                    soup = BeautifulSoup(
+                        content,
+                        "lxml",
+                        parse_only=TITLE_AND_BODY_STRAINER,
+                        from_encoding=declared_charset,
+                    )
+                except ParserRejectedMarkup:
+                    soup = BeautifulSoup(
+                        content, "html.parser", from_encoding=declared_charset
+                    )
+
+                # Remove scripts and styles (a strainer cannot exclude descendants
+                # of a tag it has already accepted, so this is still needed)
                 for script_or_style in soup(["script", "style"]):
                     script_or_style.extract()
 
@@ -233,20 +490,65 @@ class WebSearchAPI:
         except Exception as e:
             return {"error": f"An error occurred while fetching {url}: {str(e)}"}
 
+    def _get_bad_host_error(self, origin: Optional[str], url: str) -> Optional[str]:
+        """
+        Return the recorded connection error for `origin` if it failed within the last
+        BAD_HOST_TTL seconds, or None if it is not (or no longer) known to be failing.
+
+        The error text is the original one, with the failed request's path swapped
+        for this `url`'s, so it reads as the error a real attempt would have raised.
+        """
+        entry = self._bad_hosts.get(origin)
+        if entry is None:
+            return None
+        expires_at, error, failed_path = entry
+        if time.monotonic() >= expires_at:
+            del self._bad_hosts[origin]
+            return None
+        return error.replace(
+            f"with url: {failed_path} (", f"with url: {_url_path(url)} (", 1
+        )
+
+    def _mark_bad_host(
+        self, origin: Optional[str], failed_path: str, error: Exception
+    ) -> None:
+        """
+        Remember that `origin` failed to connect for the next BAD_HOST_TTL seconds.
+        """
+        if origin is None:
+            return
+        self._bad_hosts[origin] = (time.monotonic() + BAD_HOST_TTL, str(error), failed_path)
+
+    def _get_rng(self) -> random.Random:
+        """
+        Return the error-simulation RNG, creating it on first use.
+
+        This is a method rather than a property because the multi-turn executor
+        walks every instance attribute with `inspect.getmembers`, which would
+        evaluate a property (and seed the RNG) for every instance it sets up.
+        """
+        if self._rng is None:
+            self._rng = random.Random(1053)
+        return self._rng
+
     def _fake_requests_get_error_msg(self, url: str) -> str:
         """
         Return a realistic-looking requests/urllib3 error message.
         """
         parsed = urlparse(url)
+        rng = self._get_rng()
 
         context = {
             "url": url,
             "host": parsed.hostname or "unknown",
             "path": parsed.path or "/",
-            "id1": self._rng.randrange(0x10000000, 0xFFFFFFFF),
-            "id2": self._rng.randrange(0x10000000, 0xFFFFFFFF),
+            "id1": rng.randrange(0x10000000, 0xFFFFFFFF),
+            "id2": rng.randrange(0x10000000, 0xFFFFFFFF),
         }
 
-        template = self._rng.choice(ERROR_TEMPLATES)
+        template = rng.choice(_PARSED_ERROR_TEMPLATES)
 
-        return template.format(**context)
+        return "".join(
+            literal if field is None else literal + format(context[field], spec)
+            for literal, field, spec in template
+        )
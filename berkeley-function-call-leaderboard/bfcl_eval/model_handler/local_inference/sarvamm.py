@@ -18,6 +18,15 @@ class SarvamMHandler(OSSHandler):
       [INST]last_user[/INST]<think>\n   <-- model starts generating here
     """
 
+    # Fixed system-prompt fragments from the chat template (thinking enabled)
+    THINK_SYSTEM_MESSAGE_ADDITION = (
+        "Think deeply before answering the user's question. "
+        "Do the thinking inside <think>...</think> tags."
+    )
+    DEFAULT_THINK_SYSTEM_MESSAGE = (
+        "You are a helpful assistant. " + THINK_SYSTEM_MESSAGE_ADDITION
+    )
+
     def __init__(
         self,
         model_name: str,
@@ -36,6 +45,24 @@ class SarvamMHandler(OSSHandler):
             dtype=dtype,
             **kwargs,
         )
+        # Prompt constants derived from the tokenizer; it is only loaded once the
+        # server spins up, so these are filled in by the first `_format_prompt`
+        self._bos_token = None
+        self._eos_token = None
+        self._default_system_prefix = None
+
+    def _init_prompt_constants(self) -> None:
+        """
+        Cache the BOS/EOS tokens and the default system prefix built from them,
+        so `_format_prompt` does not rebuild them on every call.
+        """
+        self._bos_token = self.tokenizer.bos_token or ""
+        self._eos_token = self.tokenizer.eos_token or ""
+        # Prefix used whenever the conversation has no system message of its own
+        self._default_system_prefix = (
+            f"{self._bos_token}\n\n"
+            f"[SYSTEM_PROMPT]{self.DEFAULT_THINK_SYSTEM_MESSAGE}[/SYSTEM_PROMPT]"
+        )
 
     # ---------------------------------------------------------------------
     # Prompt formatting (Python version of your Jinja chat template)
@@ -140,112 +167,100 @@ class SarvamMHandler(OSSHandler):
 
         """
 
-        # Get BOS/EOS tokens from tokenizer
-        bos_token = self.tokenizer.bos_token or ""
-        eos_token = self.tokenizer.eos_token or ""
-
-        default_think_system_message = (
-            "You are a helpful assistant. "
-            "Think deeply before answering the user's question. "
-            "Do the thinking inside <think>...</think> tags."
-        )
-        default_nothink_system_message = "You are a helpful assistant."
-        think_system_message_addition = (
-            "Think deeply before answering the user's question. "
-            "Do the thinking inside <think>...</think> tags."
-        )
+        if self._bos_token is None:
+            self._init_prompt_constants()
+        eos_token = self._eos_token
 
         # --- Determine system_message and loop_messages ---
         # We always assume thinking is enabled, so we follow the "thinking" branches.
         if messages and messages[0]["role"] == "system":
             # enable_thinking != false => prepend the think addition
             system_message = (
-                think_system_message_addition + "\n\n" + messages[0]["content"]
+                self.THINK_SYSTEM_MESSAGE_ADDITION + "\n\n" + messages[0]["content"]
             )
             loop_messages = messages[1:]
+            system_prefix = (
+                f"{self._bos_token}\n\n[SYSTEM_PROMPT]{system_message}[/SYSTEM_PROMPT]"
+            )
         else:
-            # no explicit system => use default "think" system prompt
-            system_message = default_think_system_message
+            # no explicit system => use the cached default "think" system prompt
             loop_messages = messages
-
-        # --- Start building the formatted prompt ---
-        formatted_prompt = ""
-        formatted_prompt += bos_token + "\n\n"
-        formatted_prompt += f"[SYSTEM_PROMPT]{system_message}[/SYSTEM_PROMPT]"
-
+            system_prefix = self._default_system_prefix
 
         # --- Serialize loop_messages (user/assistant turns) ---
         # The template expects: user, assistant, user, assistant, ...
         # starting with user (index 0 in loop_messages).
         num_loop = len(loop_messages)
 
+        # Validate the turn structure up front, so the serialization loop below
+        # needs no per-turn alternation checks
         for idx, message in enumerate(loop_messages):
             role = message["role"]
-            content = message.get("content", "") or ""
-
-            if role == "user":
-                # Enforce alternation: user must be at even positions (0, 2, 4, ...)
-                if idx % 2 == 1:
-                    raise ValueError(
-                        "User and assistant turns must alternate starting with user turn! "
-                        f"Found user at loop index {idx}."
-                    )
-
-                is_last = idx == num_loop - 1
-
-                if is_last:
-                    # Last user turn: add <think>\n for thinking-enabled mode
-                    formatted_prompt += f"[INST]{content}[/INST]<think>\n"
-                else:
-                    formatted_prompt += f"[INST]{content}[/INST]"
-
-            elif role == "assistant":
-                # Enforce alternation: assistant must be at odd positions (1, 3, 5, ...)
-                if idx % 2 == 0:
-                    raise ValueError(
-                        "User and assistant turns must alternate starting with user turn! "
-                        f"Found assistant at loop index {idx}."
-                    )
-
-                # Extract visible content + reasoning_content
-                reasoning_content = ""
-                if "reasoning_content" in message and message["reasoning_content"]:
-                    reasoning_content = message["reasoning_content"]
-                elif "</think>" in content:
-                    # Parse inline <think>...</think>
-                    parts = content.split("</think>")
-                    # Everything after </think> is visible content
-                    content = parts[-1].lstrip("\n")
-                    # Everything between <think> and </think> is reasoning
-                    reasoning_content = (
-                        parts[0].rstrip("\n").split("<think>")[-1].lstrip("\n")
-                    )
-
-                is_last = idx == num_loop - 1
-
-                if is_last and reasoning_content:
-                    # For the last assistant in history, if we have reasoning
-                    # and thinking is enabled, re-materialize the think tags.
-                    formatted_prompt += (
-                        "<think>\n"
-                        + reasoning_content.strip("\n")
-                        + "\n</think>\n\n"
-                        + content.lstrip("\n")
-                        + eos_token
-                    )
-                else:
-                    # Historical assistant or no reasoning: just append content + EOS
-                    formatted_prompt += content + eos_token
-
-            else:
+            if role not in ("user", "assistant"):
                 # The template only supports system (already handled as first),
                 # user, and assistant.
                 raise ValueError(
                     f"Only 'user', 'system', and 'assistant' roles are supported in "
                     f"sarvam_m template, but got: {role!r}"
                 )
+            # user must be at even positions (0, 2, 4, ...), assistant at odd ones
+            if role != ("user" if idx % 2 == 0 else "assistant"):
+                raise ValueError(
+                    "User and assistant turns must alternate starting with user turn! "
+                    f"Found {role} at loop index {idx}."
+                )
+
+        # One fragment per turn after the system prefix; joined once at the end
+        prompt_parts = [None] * (1 + num_loop)
+        prompt_parts[0] = system_prefix
+        last_idx = num_loop - 1
+
+        for idx, message in enumerate(loop_messages):
+            content = message.get("content", "") or ""
+
+            if message["role"] == "user":
+                if idx == last_idx:
+                    # Last user turn: add <think>\n for thinking-enabled mode
+                    prompt_parts[idx + 1] = f"[INST]{content}[/INST]<think>\n"
+                else:
+                    prompt_parts[idx + 1] = f"[INST]{content}[/INST]"
+                continue
+
+            # Extract visible content + reasoning_content
+            reasoning_content = ""
+            if message.get("_parsed"):
+                # Added by `_add_assistant_message_prompting`, so the think block
+                # is already split out; no need to re-scan it on every turn
+                reasoning_content = message["reasoning_content"]
+            elif "reasoning_content" in message and message["reasoning_content"]:
+                reasoning_content = message["reasoning_content"]
+            elif (think_end := content.find("</think>")) != -1:
+                # Parse inline <think>...</think> by index, without split lists
+                # Everything between <think> and the first </think> is reasoning
+                before = content[:think_end].rstrip("\n")
+                think_start = before.rfind("<think>")
+                if think_start != -1:
+                    before = before[think_start + len("<think>") :]
+                reasoning_content = before.lstrip("\n")
+                # Everything after the last </think> is visible content
+                think_end = content.rfind("</think>")
+                content = content[think_end + len("</think>") :].lstrip("\n")
+
+            if idx == last_idx and reasoning_content:
+                # For the last assistant in history, if we have reasoning
+                # and thinking is enabled, re-materialize the think tags.
+                prompt_parts[idx + 1] = (
+                    "<think>\n"
+                    + reasoning_content.strip("\n")
+                    + "\n</think>\n\n"
+                    + content.lstrip("\n")
+                    + eos_token
+                )
+            else:
+                # Historical assistant or no reasoning: just append content + EOS
+                prompt_parts[idx + 1] = content + eos_token
 
-        return formatted_prompt
+        return "".join(prompt_parts)
 
     # ---------------------------------------------------------------------
     # Response parsing: split <think>...</think> from visible answer
@@ -261,17 +276,18 @@ class SarvamMHandler(OSSHandler):
         reasoning_content = ""
         cleaned_response = model_response
 
-        if "</think>" in model_response:
-            parts = model_response.split("</think>")
-            # Visible answer is everything after </think>
-            cleaned_response = parts[-1].lstrip("\n")
-            # Reasoning is everything between <think> and </think>
-            reasoning_content = (
-                parts[0].rstrip("\n").split("<think>")[-1].lstrip("\n")
-            )
+        # partition/rpartition return fixed-size tuples rather than split lists
+        head, sep, _ = model_response.partition("</think>")
+        if sep:
+            # Visible answer is everything after the last </think>
+            cleaned_response = model_response.rpartition("</think>")[2].lstrip("\n")
+            # Reasoning is everything between <think> and the first </think>
+            reasoning_content = head.rpartition("<think>")[2].strip("\n")
 
         # Optionally strip trailing EOS token if present
-        eos_token = self.tokenizer.eos_token or ""
+        if self._eos_token is None:
+            self._init_prompt_constants()
+        eos_token = self._eos_token
         if eos_token and cleaned_response.endswith(eos_token):
             cleaned_response = cleaned_response[: -len(eos_token)].rstrip()
 
@@ -292,12 +308,16 @@ class SarvamMHandler(OSSHandler):
         """
         Save both visible content and reasoning_content so that future calls
         to `_format_prompt` can reconstruct <think> blocks if needed.
+
+        The `_parsed` flag tells `_format_prompt` the content is already free of
+        think tags; messages from any other source are still parsed inline.
         """
         inference_data["message"].append(
             {
                 "role": "assistant",
                 "content": model_response_data["model_responses"],
                 "reasoning_content": model_response_data.get("reasoning_content", ""),
+                "_parsed": True,
             }
         )
         return inference_data